@@ -0,0 +1,213 @@
+# WeasyPrint rendering for the report API. Kept apart from report_with_api so the
+# PDF worker processes import only WeasyPrint, not FastAPI or the Gemini client.
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+
+# --- Shared Report Stylesheet ---
+# Parsed once at import so WeasyPrint does not re-tokenize the CSS and re-load
+# the IBMPlexSans font files on every request. The suitability score color is
+# dynamic and is therefore set inline on the header element.
+SHARED_CSS = """
+@font-face {
+    font-family: "IBMPlexSans";
+    src: url("fonts/IBMPlexSans-Regular.ttf");
+    font-weight: normal;
+    font-style: normal;
+}
+@font-face {
+    font-family: "IBMPlexSans";
+    src: url("fonts/IBMPlexSans-Medium.ttf");
+    font-weight: 500;
+    font-style: normal;
+}
+@font-face {
+    font-family: "IBMPlexSans";
+    src: url("fonts/IBMPlexSans-Bold.ttf");
+    font-weight: bold;
+    font-style: normal;
+}
+body {
+    font-family: "IBMPlexSans", sans-serif;
+    line-height: 1.7;
+    margin: 25px;
+    color: #333;
+    background-color: #ffffff;
+    font-size: 10pt;
+    position: relative;
+    margin-bottom: 40px;
+    width: 100vw;
+}
+h1 {
+    color: #2c3e50;
+    text-align: center;
+    border-bottom: 2px solid #2b3d4f;
+    padding-bottom: 10px;
+    font-size: 24px;
+    font-weight: bold;
+}
+h2 {
+    color: #34495e;
+    margin-top: 35px;
+    border-bottom: 1px solid #bdc3c7;
+    padding-bottom: 8px;
+    font-size: 20px;
+    font-weight: 500;
+}
+h3 {
+    color: #7f8c8d;
+    font-size: 16px;
+    margin-bottom: 15px;
+    font-weight: 500;
+}
+.section { margin-bottom: 30px; }
+#pie-chart-placeholder { width: 100%; height: auto; margin: 20px auto; text-align: center; }
+
+/* Watermark Image Container */
+.watermark-image-container {
+    position: fixed;
+    top: 50%;
+    left: 50%;
+    transform: translate(-50%, -50%);
+    z-index: -1;
+    pointer-events: none;
+    opacity: 0.05;
+    width: 70%;
+    max-width: 600px;
+    height: auto;
+    text-align: center;
+}
+.watermark-image-container img {
+    width: 100%;
+    height: auto;
+    display: block;
+    margin: 0 auto;
+}
+
+/* Page layout for WeasyPrint - EDITED PART */
+@page {
+    margin: 70px 12.5px 70px 12.5px;
+    @top-left {
+        content: element(header_logo);
+        vertical-align: top;
+    }
+    @top-right {
+        content: element(header_info);
+        vertical-align: top;
+    }
+    @bottom-center {
+        content: element(footer_content);
+        vertical-align: bottom;
+        padding-bottom: 10px;
+    }
+}
+
+/* Footer style */
+.page-footer {
+    display: block;
+    position: running(footer_content);
+    width: 100%;
+    background-color: #ffffff;
+    padding: 10px 10px;
+    text-align: center;
+    font-size: 8px;
+    color: #555;
+    box-sizing: border-box;
+}
+.footer-divider {
+    border-top: 0.5px solid #ccc;
+    margin: 0 auto 5px auto;
+    width: 90%;
+}
+.footer-company-name {
+    font-weight: bold;
+    margin-bottom: 2px;
+}
+.footer-contact-info {
+    font-size: 7px;
+    line-height: 1.2;
+    white-space: nowrap;
+    display: flex;
+    justify-content: center;
+    gap: 10px;
+}
+
+/* LOGO HEADER - EDITED PART */
+.page-header-logo {
+    margin-top: 20px;
+    margin-left: 20px;
+    position: running(header_logo);
+    text-align: left;
+}
+.page-header-logo img {
+    width: 40px;
+    height: auto;
+    display: inline-block;
+}
+
+/* TOP RIGHT INFO BOX - REINTRODUCED AND MODIFIED */
+.page-header-info {
+    margin-top: 30px;
+    margin-right: 20px;
+    position: running(header_info);
+    text-align: right; /* Align right */
+    font-size: 15px; /* Slightly larger font */
+    color: #223;
+    line-height: 1.2;
+    min-width: 150px;
+    font-weight: bold; /* Make it bold */
+}
+.suitability-label {
+    color: #2b3d4f; /* Fixed color for "Pozisyona Uygunluk:" */
+}
+
+/* Emotion charts */
+.emotion-chart {
+    text-align: center;
+    margin: 20px auto;
+    opacity: 0.6;
+}
+.emotion-chart svg {
+    background-color: #fcfcfc;
+    border: 1px solid #eee;
+    border-radius: 8px;
+}
+
+/* Questions and answers */
+.qa-item {
+    margin-bottom: 15px;
+    padding: 12px;
+    border: 1px solid #e0e0e0;
+    border-radius: 8px;
+}
+.qa-question {
+    font-weight: bold;
+    color: #34495e;
+}
+.qa-answer {
+    color: #555;
+    margin-top: 5px;
+}
+"""
+
+FONT_CONFIG = FontConfiguration()
+SHARED_STYLESHEET = CSS(string=SHARED_CSS, base_url=".", font_config=FONT_CONFIG)
+
+
+def create_pdf_from_html(html_content: str) -> bytes:
+    """
+    Creates a PDF document from an HTML string using WeasyPrint and returns its bytes.
+    Applies the shared stylesheet and font configuration parsed at import.
+    """
+    try:
+        html = HTML(string=html_content, base_url=".")
+        return html.write_pdf(
+            stylesheets=[SHARED_STYLESHEET],
+            font_config=FONT_CONFIG,
+            # Re-encode and downsample the embedded logo/watermark rasters
+            optimize_images=True,
+            jpeg_quality=80,
+            dpi=150,
+        )
+    except Exception as e:
+        print(f"Error creating WeasyPrint PDF: {e}")
+        raise ValueError(f"WeasyPrint error occurred while creating PDF: {e}")
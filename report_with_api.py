@@ -1,26 +1,53 @@
 import os
 import io
+import csv
+import re
+import asyncio
+import string
+import json
+import hashlib
+import functools
+import multiprocessing
 import urllib.parse
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
 import base64
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
-import pandas as pd
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Response
+from fastapi.middleware.gzip import GZipMiddleware
 import google.generativeai as genai
-from bs4 import BeautifulSoup
-from weasyprint import HTML
 from dotenv import load_dotenv
-import matplotlib.pyplot as plt
+from pdf_renderer import create_pdf_from_html
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Write the final report HTML to the working directory for debugging (DEBUG_HTML=1)
+DEBUG_HTML = os.environ.get("DEBUG_HTML") == "1"
+
 # --- FastAPI Application Initialization ---
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Stop the PDF worker pool (PDF_EXECUTOR, defined below) on server shutdown
+    yield
+    PDF_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Mülakat Raporu Oluşturucu API",
     description="CSV verilerinden tutarlı ve görsel olarak zenginleştirilmiş PDF mülakat raporları oluşturur.",
     version="1.4.0",  # Version updated to WeasyPrint for PDF generation
 )
 
+# Compress larger JSON/HTML responses for clients that accept gzip. The PDF sets
+# its own Content-Encoding so it passes through: its streams are already compressed.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # --- Gemini API Configuration ---
 try:
     GEMINI_API_KEY = os.environ["GEMINI_API_KEY"]
@@ -33,9 +60,232 @@ except KeyError:
         "GEMINI_API_KEY ortam değişkeni bulunamadı. Lütfen .env dosyasında ayarlayın."
     )
 
+# Shared by every report request
+GEN_CONFIG = genai.types.GenerationConfig(
+    temperature=0.7, response_mime_type="text/plain"
+)
+
+# Validated Gemini responses by report-row hash, least recently used evicted first
+LLM_CACHE_SIZE = 256
+_llm_cache: "OrderedDict[str, str]" = OrderedDict()
+
+# --- CSV Input Columns ---
+# Numeric columns of the report row, converted by parse_csv_number
+FLOAT_COLUMNS = (
+    "llm_skoru",
+    "avg_llm_skoru",
+    "duygu_mutlu_%",
+    "avg_duygu_mutlu_%",
+    "duygu_kizgin_%",
+    "avg_duygu_kizgin_%",
+    "duygu_igrenme_%",
+    "avg_duygu_igrenme_%",
+    "duygu_korku_%",
+    "avg_duygu_korku_%",
+    "duygu_uzgun_%",
+    "avg_duygu_uzgun_%",
+    "duygu_saskin_%",
+    "avg_duygu_saskin_%",
+    "duygu_dogal_%",
+    "avg_duygu_dogal_%",
+    "ekran_disi_sure_sn",
+    "avg_ekran_disi_sure_sn",
+)
+INT_COLUMNS = ("ekran_disi_sayisi", "avg_ekran_disi_sayisi", "tip")
+# Every column the report reads must be present in the CSV header
+TEXT_COLUMNS = ("kisi_adi", "mulakat_adi", "soru", "cevap")
+REQUIRED_COLUMNS = frozenset(TEXT_COLUMNS + FLOAT_COLUMNS + INT_COLUMNS)
+
+# --- Report Template Slots ---
+# HTML comment the LLM is told to leave untouched; filled via str.replace.
+# If the LLM drops it, the charts go into the placeholder div instead.
+CHART_SLOT = "<!--CHART_SLOT-->"
+CHART_PLACEHOLDER_DIV = '<div id="bar-chart-placeholder">'
+
+# Opening <body> tag of the LLM output; the page chrome is inserted right after it
+BODY_TAG_RE = re.compile(r"<body\b[^>]*>", re.IGNORECASE)
+
+# Content fields the LLM occasionally leaves unfilled; removed in a single pass
+PLACEHOLDER_RE = re.compile(
+    r"\{\{(genel_bakis_icerik|duygu_analizi_yorumu|dikkat_analizi_yorumu"
+    r"|genel_degerlendirme_icerik|sonuclar_oneriler_icerik)\}\}"
+)
+
+# --- Report HTML Templates ---
+# Built once at import; only the candidate name and the Q&A section vary per
+# request. The {{...}} fields are filled in by the LLM.
+REPORT_HTML_TEMPLATE = string.Template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+</head>
+<body>
+    <h1>$kisi_adi - Mülakat Değerlendirme Raporu</h1>
+    
+    <div class="section">
+        <h2>1) Genel Bakış</h2>
+        <p>{{genel_bakis_icerik}}</p>
+    </div>
+    
+    <div class="section">
+        <h2>2) Analiz</h2>
+        <h3>Duygu Analizi:</h3>
+        <div id="bar-chart-placeholder"><!--CHART_SLOT--></div> <p>{{duygu_analizi_yorumu}}</p>
+
+        <h3>Dikkat Analizi</h3>
+        <p>{{dikkat_analizi_yorumu}}</p>
+    </div>
+    
+    <div class="section">
+        <h2>3) Genel Değerlendirme</h2>
+        <p>{{genel_degerlendirme_icerik}}</p>
+    </div>
+
+    <div class="section">
+        <h2>4) Sorular ve Cevaplar</h2>
+        $qa_section
+    </div>
+    
+    <div class="section">
+        <h2>5) Sonuçlar ve Öneriler</h2>
+        <p>{{sonuclar_oneriler_icerik}}</p>
+    </div>
+
+    {{uygunluk_degerlendirmesi_bolumu}}
+</body>
+</html>
+""")
+
+# Header, footer and watermark are identical on every page and in every report,
+# so they are kept out of the prompt and inserted after the <body> tag in code.
+PAGE_CHROME_TEMPLATE = string.Template("""
+    <!-- Logo header element -->
+    <div class="page-header-logo" id="header_logo">
+        <img src="$logo_src" alt="Logo" />
+    </div>
+    
+    <!-- Top right info box element - Now displays suitability score -->
+    <div class="page-header-info" id="header_info">$header_info</div>
+    
+    <!-- Footer element -->
+    <div class="page-footer">
+        <div class="footer-divider"></div>
+        <div class="footer-company-name">DeepWork Bilişim Teknolojileri A.Ş.</div>
+        <div class="footer-contact-info">
+            <span>info@hrai.com.tr</span>
+            <span>-</span>
+            <span>İstanbul Medeniyet Üniversitesi Kuzey Kampüsü Medeniyet Teknopark Kuluçka Merkezi Üsküdar/İstanbul</span>
+            <span>-</span>
+            <span>+90 553 808 32 77</span>
+        </div>
+    </div>
+    
+    <!-- Watermark Image Container -->
+    <div class="watermark-image-container" id="watermark-placeholder">$watermark</div>
+""")
+
+# --- LLM Prompt Templates ---
+# Instructions per report type ("tip" column: 0 = candidate, 1 = customer).
+# Fields are the row_data keys without the trailing "_%".
+PROMPT_RULES = """Önemli Kurallar:
+- Üretilen tüm metin **sadece Türkçe** olmalıdır.
+- Raporun tonu profesyonel, resmi ve veri odaklı olmalıdır.
+- Kullanıcıya yönelik hiçbir not, açıklama veya meta-yorum ekleme.
+- Sadece ve sadece aşağıdaki HTML şablonunu doldurarak yanıt ver. Başka hiçbir metin ekleme.
+- Yer tutucuların yerine doğrudan metni yaz; metnin başına alan adı veya etiket ekleme.
+- Şablondaki HTML yorumlarını (<!--...-->) değiştirmeden olduğu gibi bırak.
+- Yanıtı Markdown kod bloğu (```) içine alma; doğrudan <!DOCTYPE html> ile başla.
+
+İşte doldurman gereken şablon:
+$html_template
+"""
+
+PROMPT_TEMPLATES = {
+    0: string.Template(
+        """
+Lütfen aşağıdaki HTML şablonunu verilen mülakat verilerine göre doldurarak eksiksiz bir HTML raporu oluştur.
+Veriler:
+- Aday Adı: ${kisi_adi}
+- Mülakat Adı: ${mulakat_adi}
+- LLM Skoru: ${llm_skoru}, Ortalama LLM Skoru: ${avg_llm_skoru}
+- Duygu Analizi (%): Mutlu ${duygu_mutlu}, Kızgın ${duygu_kizgin}, İğrenme ${duygu_igrenme}, Korku ${duygu_korku}, Üzgün ${duygu_uzgun}, Şaşkın ${duygu_saskin}, Doğal ${duygu_dogal}
+- Dikkat Analizi: Ekran Dışı Süre ${ekran_disi_sure_sn} sn, Ekran Dışı Bakış Sayısı ${ekran_disi_sayisi}, Ortalama Ekran Dışı Süre ${avg_ekran_disi_sure_sn} sn, Ortalama Ekran Dışı Bakış Sayısı ${avg_ekran_disi_sayisi}
+
+Doldurulacak Alanlar İçin Talimatlar:
+1.  `{{genel_bakis_icerik}}`: Adayın genel performansını, iletişim becerilerini ve mülakatın genel seyrini özetleyen, en az iki paragraftan oluşan detaylı bir giriş yaz.
+2.  `{{duygu_analizi_yorumu}}`: Yukarıda verilen sayısal duygu analizi verilerini yorumla. Hangi duyguların baskın olduğunu ve bunun mülakat bağlamında ne anlama gelebileceğini analiz et. Bu yorum en az iki detaylı paragraf olmalıdır. Giriş cümlesi tam olarak şu olmalı: "Görüntü ve ses analiz edilerek adayın duygu analizi yapılmıştır."
+3.  `{{dikkat_analizi_yorumu}}`: Ekran dışı süre ve bakış sayısı verilerini yorumla. Bu verilerin adayın dikkat seviyesi veya odaklanması hakkında ne gibi ipuçları verdiğini açıkla. Bu yorum en az bir detaylı paragraf olmalıdır.
+4.  `{{genel_degerlendirme_icerik}}`: Adayın verdiği cevapları, genel tavrını ve analiz sonuçlarını birleştirerek kapsamlı bir değerlendirme yap. Adayın güçlü ve gelişime açık yönlerini belirt. Bu bölüm en az üç paragraf olmalıdır.
+5.  `{{sonuclar_oneriler_icerik}}`: Bu bölümü **sadece İnsan Kaynakları profesyonellerine yönelik** olarak yaz. Adayın pozisyona uygunluğu hakkında net bir sonuca var. İşe alım kararı için somut önerilerde bulun. Adaya yönelik bir dil kullanma. Bu bölüm en az iki paragraf olmalıdır.
+6.  **YENİ TALİMAT**: `{{uygunluk_degerlendirmesi_bolumu}}`: Adayın pozisyona uygunluk yüzdesini (0-100 arası bir tam sayı) ve bu yüzdeyi destekleyen kısa bir açıklamayı HTML formatında oluştur. Yüzdeyi `${llm_skoru}` değerini dikkate alarak belirle. Örnek format:
+    ```html
+    <div class="section">
+        <h2>6) Pozisyona Uygunluk Değerlendirmesi</h2>
+        <p style="font-size: 24px; font-weight: bold; color: $suitability_color; text-align: left;">Pozisyona Uygunluk: %{{llm_score}}</p>
+        <p>Adayın genel mülakat performansı, teknik bilgi ve iletişim becerileri, pozisyonun gerektirdiği yetkinliklerle yüksek düzeyde örtüşmektedir. Duygu analizi ve dikkat seviyesi de olumlu bir tablo çizmektedir.</p>
+    </div>
+    ```
+    Yüzdeyi ve açıklamayı doldururken, verilen LLM Skoru'nu doğrudan uygunluk yüzdesi olarak kullanabilir veya bu skora dayanarak mantıklı bir uygunluk yüzdesi türetebilirsin. Açıklama 1-2 paragraf uzunluğunda olmalıdır. Pozisyona uygunluk yüzdesi metni büyük ve kalın olmalıdır.
+
+"""
+        + PROMPT_RULES
+    ),
+    1: string.Template(
+        """
+Lütfen aşağıdaki HTML şablonunu verilen mülakat verilerine göre doldurarak eksiksiz bir HTML raporu oluştur.
+Veriler:
+- Müşteri Adı: ${kisi_adi}
+- Görüşme Adı: ${mulakat_adi}
+- Duygu Analizi (%): Mutlu ${duygu_mutlu}, Kızgın ${duygu_kizgin}, İğrenme ${duygu_igrenme}, Korku ${duygu_korku}, Üzgün ${duygu_uzgun}, Şaşkın ${duygu_saskin}, Doğal ${duygu_dogal}
+- Dikkat Analizi: Ekran Dışı Süre ${ekran_disi_sure_sn} sn, Ekran Dışı Bakış Sayısı ${ekran_disi_sayisi}, Ortalama Ekran Dışı Süre ${avg_ekran_disi_sure_sn} sn, Ortalama Ekran Dışı Bakış Sayısı ${avg_ekran_disi_sayisi}
+
+Doldurulacak Alanlar İçin Talimatlar:
+1.  `{{genel_bakis_icerik}}`: Müşterinin genel performansını, iletişim becerilerini ve görüşmenin genel seyrini özetleyen, en az iki paragraftan oluşan detaylı bir giriş yaz.
+2.  `{{duygu_analizi_yorumu}}`: Yukarıda verilen sayısal duygu analizi verilerini yorumla. Hangi duyguların baskın olduğunu ve bunun görüşme bağlamında ne anlama gelebileceğini analiz et. Bu yorum en az iki detaylı paragraf olmalıdır. Giriş cümlesi tam olarak şu olmalı: "Görüntü ve ses analiz edilerek kişinin duygu analizi yapılmıştır."
+3.  `{{dikkat_analizi_yorumu}}`: Ekran dışı süre ve bakış sayısı verilerini yorumla. Bu verilerin müşterinin dikkat seviyesi veya odaklanması hakkında ne gibi ipuçları verdiğini açıkla. Bu yorum en az bir detaylı paragraf olmalıdır.
+4.  `{{genel_degerlendirme_icerik}}`: Müşterinin verdiği cevapları, genel tavrını ve analiz sonuçlarını birleştirerek kapsamlı bir değerlendirme yap. Müşterinin güçlü ve gelişime açık yönlerini belirt. Bu bölüm en az üç paragraf olmalıdır.
+5.  `{{sonuclar_oneriler_icerik}}`: Bu bölümü müşteri hakkında genel bir değerlendirme olarak yaz. 1 paragraf kadar olmalı
+
+"""
+        + PROMPT_RULES
+    ),
+}
+
+# --- Question/Answer Item Template ---
+QA_TEMPLATE = """
+        <div class="qa-item">
+            <p class="qa-question">Soru: {soru}</p>
+            <p class="qa-answer">Cevap: {cevap}</p>
+        </div>
+        """
+
+# --- Emotion Chart Tables ---
+# Shared by both SVG chart generators instead of being rebuilt on every call.
+# (value column, average column, label, bar color) in chart order
+EMOTION_TABLE = (
+    ("duygu_mutlu_%", "avg_duygu_mutlu_%", "Mutlu", "#d4eac8"),
+    ("duygu_kizgin_%", "avg_duygu_kizgin_%", "Kızgın", "#e5b9b5"),
+    ("duygu_igrenme_%", "avg_duygu_igrenme_%", "İğrenme", "#d3cdd7"),
+    ("duygu_korku_%", "avg_duygu_korku_%", "Korku", "#a9b4c2"),
+    ("duygu_uzgun_%", "avg_duygu_uzgun_%", "Üzgün", "#b7d0e2"),
+    ("duygu_saskin_%", "avg_duygu_saskin_%", "Şaşkın", "#fdeac9"),
+    ("duygu_dogal_%", "avg_duygu_dogal_%", "Doğal", "#d8d8d8"),
+)
+
 # --- Helper Functions ---
 
 
+@functools.lru_cache(maxsize=32)
+def _read_image_base64(image_path: str, mtime: float) -> str:
+    """
+    Reads an image file and Base64 encodes it. Cached per (path, mtime), so an
+    edited file is read again while an unchanged one costs no I/O.
+    """
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode("utf-8")
+
+
 def get_image_base64(image_name: str) -> str:
     """
     Reads the specified image file (assuming it's in the same directory as the script)
@@ -47,9 +297,7 @@ def get_image_base64(image_name: str) -> str:
     print(f"Trying: Image file path: {image_path}")
 
     try:
-        with open(image_path, "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        return encoded_string
+        return _read_image_base64(image_path, os.path.getmtime(image_path))
     except FileNotFoundError:
         print(f"Error: Image file not found: {image_path}")
         return ""
@@ -58,6 +306,23 @@ def get_image_base64(image_name: str) -> str:
         return ""
 
 
+# The logo never changes while the server runs, so read and encode it once.
+_logo_base64 = get_image_base64("logo.png")
+LOGO_DATA_URI = f"data:image/png;base64,{_logo_base64}" if _logo_base64 else ""
+if LOGO_DATA_URI:
+    WATERMARK_HTML = f'<img src="{LOGO_DATA_URI}" alt="Deepwork Logo Filigranı" />'
+else:
+    WATERMARK_HTML = ""
+    print("Warning: logo.png not found or could not be read. Watermark not added.")
+
+# Logo and watermark are fixed per process; only the header score is left open
+STATIC_PAGE_CHROME = string.Template(
+    PAGE_CHROME_TEMPLATE.safe_substitute(
+        logo_src=LOGO_DATA_URI, watermark=WATERMARK_HTML
+    )
+)
+
+
 def create_emotion_charts_html(emotion_data: dict) -> str:
     """
     Generates a modern and stylish SVG bar chart from emotion data.
@@ -68,49 +333,18 @@ def create_emotion_charts_html(emotion_data: dict) -> str:
     Returns:
         An HTML string containing the SVG bar chart or a message if no data is available.
     """
-    labels_map = {
-        "duygu_mutlu_%": "Mutlu",
-        "duygu_kizgin_%": "Kızgın",
-        "duygu_igrenme_%": "İğrenme",
-        "duygu_korku_%": "Korku",
-        "duygu_uzgun_%": "Üzgün",
-        "duygu_saskin_%": "Şaşkın",
-        "duygu_dogal_%": "Doğal",
-    }
-
-    colors = {
-        "Mutlu": "#d4eac8",
-        "Kızgın": "#e5b9b5",
-        "İğrenme": "#d3cdd7",
-        "Korku": "#a9b4c2",
-        "Üzgün": "#b7d0e2",
-        "Şaşkın": "#fdeac9",
-        "Doğal": "#d8d8d8",
-    }
-
-    emotion_values = []
-    emotion_keys_ordered = [
-        "duygu_mutlu_%",
-        "duygu_kizgin_%",
-        "duygu_igrenme_%",
-        "duygu_korku_%",
-        "duygu_uzgun_%",
-        "duygu_saskin_%",
-        "duygu_dogal_%",
+    emotion_values = [
+        (label, emotion_data[key], color)
+        for key, _, label, color in EMOTION_TABLE
+        if key in emotion_data
     ]
 
-    for key in emotion_keys_ordered:
-        if key in emotion_data:
-            emotion_name = labels_map.get(key, "Bilinmeyen")
-            value = emotion_data.get(key, 0)
-            emotion_values.append({"name": emotion_name, "value": value})
-
     if not emotion_values:
         return "<p>Görselleştirilecek duygu verisi bulunamadı.</p>"
 
     # Calculate dynamic SVG height
     base_height = 250  # Height corresponding to 100% value
-    max_value = max(e["value"] for e in emotion_values)
+    max_value = max(value for _, value, _ in emotion_values)
     if max_value < 5:
         max_value = 5  # Minimum limit to prevent very small values
     svg_height = int((max_value / 100) * base_height) + 80  # + padding
@@ -150,11 +384,10 @@ def create_emotion_charts_html(emotion_data: dict) -> str:
             f'<line x1="{padding}" y1="{y_val}" x2="{padding + 5}" y2="{y_val}" stroke="#ccc" stroke-width="0.5"/>'
         )
 
-    for i, emotion in enumerate(emotion_values):
+    for i, (label, value, fill_color) in enumerate(emotion_values):
         x = padding + i * (bar_width + bar_spacing)
-        bar_height = (emotion["value"] / max_value) * (svg_height - 2 * padding)
+        bar_height = (value / max_value) * (svg_height - 2 * padding)
         y = svg_height - padding - bar_height
-        fill_color = colors.get(emotion["name"], "#cccccc")
 
         svg_elements.append(
             f'<rect x="{x}" y="{y}" width="{bar_width}" height="{bar_height}" fill="{fill_color}" rx="3" ry="3"/>'
@@ -168,16 +401,16 @@ def create_emotion_charts_html(emotion_data: dict) -> str:
             text_fill = "#333"
 
         svg_elements.append(
-            f'<text x="{x + bar_width / 2}" y="{text_y}" font-family="IBMPlexSans" font-size="12" text-anchor="middle" fill="{text_fill}" font-weight="bold">{emotion["value"]:.1f}%</text>'
+            f'<text x="{x + bar_width / 2}" y="{text_y}" font-family="IBMPlexSans" font-size="12" text-anchor="middle" fill="{text_fill}" font-weight="bold">{value:.1f}%</text>'
         )
 
         svg_elements.append(
-            f'<text x="{x + bar_width / 2}" y="{svg_height - padding + 20}" font-family="IBMPlexSans" font-size="11" text-anchor="middle" fill="#555">{emotion["name"]}</text>'
+            f'<text x="{x + bar_width / 2}" y="{svg_height - padding + 20}" font-family="IBMPlexSans" font-size="11" text-anchor="middle" fill="#555">{label}</text>'
         )
 
     svg_content = f"""
-    <div style="text-align: center; margin: 20px auto; opacity: 0.6;">
-        <svg width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}" style="background-color: #fcfcfc; border: 1px solid #eee; border-radius: 8px;">
+    <div class="emotion-chart">
+        <svg width="{svg_width}" height="{svg_height}" viewBox="0 0 {svg_width} {svg_height}">
             {''.join(svg_elements)}
         </svg>
     </div>
@@ -190,60 +423,17 @@ def create_emotion_charts_html_2(emotion_data: dict) -> str:
     Draws the bar chart with (candidate value – average) difference instead of absolute percentages.
     Bars go downwards for negative differences.
     """
-    labels_map = {
-        "duygu_mutlu_%": "Mutlu",
-        "duygu_kizgin_%": "Kızgın",
-        "duygu_igrenme_%": "İğrenme",
-        "duygu_korku_%": "Korku",
-        "duygu_uzgun_%": "Üzgün",
-        "duygu_saskin_%": "Şaşkın",
-        "duygu_dogal_%": "Doğal",
-    }
-
-    colors = {
-        "Mutlu": "#d4eac8",
-        "Kızgın": "#e5b9b5",
-        "İğrenme": "#d3cdd7",
-        "Korku": "#a9b4c2",
-        "Üzgün": "#b7d0e2",
-        "Şaşkın": "#fdeac9",
-        "Doğal": "#d8d8d8",
-    }
-
-    # Original order
-    emotion_keys = [
-        "duygu_mutlu_%",
-        "duygu_kizgin_%",
-        "duygu_igrenme_%",
-        "duygu_korku_%",
-        "duygu_uzgun_%",
-        "duygu_saskin_%",
-        "duygu_dogal_%",
-    ]
-    avg_keys = [
-        "avg_duygu_mutlu_%",
-        "avg_duygu_kizgin_%",
-        "avg_duygu_igrenme_%",
-        "avg_duygu_korku_%",
-        "avg_duygu_uzgun_%",
-        "avg_duygu_saskin_%",
-        "avg_duygu_dogal_%",
-    ]
-
     # Calculate differences
-    diffs = []
-    for key, avg_key in zip(emotion_keys, avg_keys):
-        name = labels_map[key]
-        val = emotion_data.get(key, 0)
-        avg = emotion_data.get(avg_key, 0)
-        diff = round(val - avg, 2)
-        diffs.append({"name": name, "value": diff})
+    diffs = [
+        (label, round(emotion_data.get(key, 0) - emotion_data.get(avg_key, 0), 2), color)
+        for key, avg_key, label, color in EMOTION_TABLE
+    ]
 
     if not diffs:
         return "<p>Görselleştirilecek duygu verisi bulunamadı.</p>"
 
     # Scale: largest absolute difference
-    max_abs = max(abs(d["value"]) for d in diffs)
+    max_abs = max(abs(val) for _, val, _ in diffs)
     if max_abs < 5:
         max_abs = 5
 
@@ -289,15 +479,13 @@ def create_emotion_charts_html_2(emotion_data: dict) -> str:
         )
 
     # Bars
-    for i, item in enumerate(diffs):
+    for i, (name, val, color) in enumerate(diffs):
         x = padding + i * (bar_width + bar_spacing)
-        val = item["value"]
         height = abs(val) / max_abs * panel
         if val >= 0:
             y = baseline_y - height
         else:
             y = baseline_y
-        color = colors.get(item["name"], "#ccc")
         svg_elems.append(
             f'<rect x="{x}" y="{y}" width="{bar_width}" height="{height}" '
             f'fill="{color}" rx="3" ry="3"/>'
@@ -313,33 +501,45 @@ def create_emotion_charts_html_2(emotion_data: dict) -> str:
         svg_elems.append(
             f'<text x="{x+bar_width/2}" y="{baseline_y + panel + 20}" '
             f'font-family="IBMPlexSans" font-size="11" text-anchor="middle" fill="#555">'
-            f'{item["name"]}</text>'
+            f"{name}</text>"
         )
 
     svg = (
-        f'<div style="text-align:center;margin:20px auto;opacity:0.6;">'
+        f'<div class="emotion-chart">'
         f'<svg width="{svg_width}" height="{svg_height}" '
-        f'viewBox="0 0 {svg_width} {svg_height}" '
-        f'style="background-color:#fcfcfc;border:1px solid #eee;border-radius:8px;">'
+        f'viewBox="0 0 {svg_width} {svg_height}">'
         + "".join(svg_elems)
         + "</svg></div>"
     )
     return svg
 
 
+def parse_csv_number(row: dict, column: str, integer: bool = False):
+    """
+    Converts a numeric CSV cell. Integral values stay int so the prompt reads
+    "44" rather than "44.0"; others are rounded to two decimals.
+    Raises a 400 naming the column if the cell is empty or not a number.
+    """
+    raw = row[column]
+    try:
+        value = float(raw)
+        if integer or value.is_integer():
+            return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{column}' sütunundaki değer geçerli bir sayı değil: '{raw or ''}'",
+        )
+    return round(value, 2)
+
+
 def format_qa_section(qa_list: list) -> str:
     """
     Converts a list of questions and answers into a readable HTML format.
     """
-    html = ""
-    for item in qa_list:
-        html += f"""
-        <div class="qa-item" style="margin-bottom: 15px; padding: 12px; border: 1px solid #e0e0e0; border-radius: 8px;">
-            <p style="font-weight: bold; color: #34495e;">Soru: {item['soru']}</p>
-            <p style="color: #555; margin-top: 5px;">Cevap: {item['cevap']}</p>
-        </div>
-        """
-    return html
+    return "".join(
+        QA_TEMPLATE.format(soru=item["soru"], cevap=item["cevap"]) for item in qa_list
+    )
 
 
 def get_suitability_color(score: float, avg_score: float) -> str:
@@ -363,324 +563,154 @@ def get_suitability_color(score: float, avg_score: float) -> str:
         return "#f44336"  # Red
 
 
+def insert_page_chrome(html_content: str, page_chrome_html: str) -> str:
+    """
+    Inserts the page header, footer and watermark right after the <body> tag.
+    Falls back to the start of the document if the LLM output has no <body> tag.
+    """
+    body_tag = BODY_TAG_RE.search(html_content)
+    if body_tag is None:
+        print("Warning: <body> tag not found in LLM output. Page chrome added at the start.")
+        return page_chrome_html + html_content
+    end = body_tag.end()
+    return html_content[:end] + page_chrome_html + html_content[end:]
+
+
+def insert_charts(html_content: str, charts_html: str) -> str:
+    """
+    Fills CHART_SLOT with the emotion charts, or the chart placeholder div
+    if the LLM dropped the slot comment.
+    """
+    if CHART_SLOT in html_content:
+        return html_content.replace(CHART_SLOT, charts_html)
+    if CHART_PLACEHOLDER_DIV in html_content:
+        print("Warning: CHART_SLOT not found in LLM output. Charts added to the placeholder div.")
+        return html_content.replace(
+            CHART_PLACEHOLDER_DIV, CHART_PLACEHOLDER_DIV + charts_html, 1
+        )
+    print("Warning: CHART_SLOT and chart placeholder not found in LLM output. Charts not added.")
+    return html_content
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Removes surrounding whitespace and an optional ```html ... ``` fence from the LLM output.
+    Plain string operations keep this linear in the response length.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        # Drop only the fence and its language tag; content may share the line
+        text = text[3:]
+        if text[:4].lower() == "html":
+            text = text[4:]
+        text = text.lstrip()
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
 def generate_llm_prompt(row_data: dict, formatted_qa_html: str) -> str:
     """
     Generates the prompt for Gemini LLM based on the given aggregated data row
     and a new, cleaner HTML template.
-    The watermark image is not sent to the LLM, it will be added later.
+    The page header, footer and watermark are not sent to the LLM, they are added later.
     """
 
     # Determine the color for the suitability score based on avg_llm_skoru
     suitability_color = get_suitability_color(row_data['llm_skoru'], row_data['avg_llm_skoru'])
 
-    html_template = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <style>
-        @font-face {{
-            font-family: "IBMPlexSans";
-            src: url("fonts/IBMPlexSans-Regular.ttf");
-            font-weight: normal;
-            font-style: normal;
-        }}
-        @font-face {{
-            font-family: "IBMPlexSans";
-            src: url("fonts/IBMPlexSans-Medium.ttf");
-            font-weight: 500;
-            font-style: normal;
-        }}
-        @font-face {{
-            font-family: "IBMPlexSans";
-            src: url("fonts/IBMPlexSans-Bold.ttf");
-            font-weight: bold;
-            font-style: normal;
-        }}
-        body {{
-            font-family: "IBMPlexSans", sans-serif;
-            line-height: 1.7;
-            margin: 25px;
-            color: #333;
-            background-color: #ffffff;
-            font-size: 10pt;
-            position: relative;
-            margin-bottom: 40px;
-            width: 100vw;
-        }}
-        h1 {{ 
-            color: #2c3e50; 
-            text-align: center; 
-            border-bottom: 2px solid #2b3d4f; 
-            padding-bottom: 10px; 
-            font-size: 24px; 
-            font-weight: bold;
-        }}
-        h2 {{ 
-            color: #34495e; 
-            margin-top: 35px; 
-            border-bottom: 1px solid #bdc3c7; 
-            padding-bottom: 8px; 
-            font-size: 20px;
-            font-weight: 500;
-        }}
-        h3 {{ 
-            color: #7f8c8d; 
-            font-size: 16px; 
-            margin-bottom: 15px; 
-            font-weight: 500;
-        }}
-        .section {{ margin-bottom: 30px; }}
-        #pie-chart-placeholder {{ width: 100%; height: auto; margin: 20px auto; text-align: center; }}
-
-        /* Watermark Image Container */
-        .watermark-image-container {{
-            position: fixed;
-            top: 50%;
-            left: 50%;
-            transform: translate(-50%, -50%);
-            z-index: -1;
-            pointer-events: none;
-            opacity: 0.05;
-            width: 70%;
-            max-width: 600px;
-            height: auto;
-            text-align: center;
-        }}
-        .watermark-image-container img {{
-            width: 100%;
-            height: auto;
-            display: block;
-            margin: 0 auto;
-        }}
-
-        /* Page layout for WeasyPrint - EDITED PART */
-        @page {{
-            margin: 70px 12.5px 70px 12.5px;
-            @top-left {{
-                content: element(header_logo);
-                vertical-align: top;
-            }}
-            @top-right {{
-                content: element(header_info);
-                vertical-align: top;
-            }}
-            @bottom-center {{
-                content: element(footer_content);
-                vertical-align: bottom;
-                padding-bottom: 10px;
-            }}
-        }}
-
-        /* Footer style */
-        .page-footer {{
-            display: block;
-            position: running(footer_content);
-            width: 100%;
-            background-color: #ffffff;
-            padding: 10px 10px;
-            text-align: center;
-            font-size: 8px;
-            color: #555;
-            box-sizing: border-box;
-        }}
-        .footer-divider {{
-            border-top: 0.5px solid #ccc;
-            margin: 0 auto 5px auto;
-            width: 90%;
-        }}
-        .footer-company-name {{
-            font-weight: bold;
-            margin-bottom: 2px;
-        }}
-        .footer-contact-info {{
-            font-size: 7px;
-            line-height: 1.2;
-            white-space: nowrap;
-            display: flex;
-            justify-content: center;
-            gap: 10px;
-        }}
-
-        /* LOGO HEADER - EDITED PART */
-        .page-header-logo {{
-            margin-top: 20px;
-            margin-left: 20px;
-            position: running(header_logo);
-            text-align: left;
-        }}
-        .page-header-logo img {{
-            width: 40px;
-            height: auto;
-            display: inline-block;
-        }}
-
-        /* TOP RIGHT INFO BOX - REINTRODUCED AND MODIFIED */
-        .page-header-info {{
-            margin-top: 30px;
-            margin-right: 20px;
-            position: running(header_info);
-            text-align: right; /* Align right */
-            font-size: 15px; /* Slightly larger font */
-            color: #223;
-            line-height: 1.2;
-            min-width: 150px;
-            font-weight: bold; /* Make it bold */
-        }}
-        .suitability-score {{
-            color: {suitability_color}; /* Dynamic color based on score */
-        }}
-        .suitability-label {{
-            color: #2b3d4f; /* Fixed color for "Pozisyona Uygunluk:" */
-        }}
-    </style>
-</head>
-<body>
-    <!-- Logo header element -->
-    <div class="page-header-logo" id="header_logo">
-        <img src="{{{{logo_src}}}}" alt="Logo" />
-    </div>
-    
-    <!-- Top right info box element - Now displays suitability score -->
-    <div class="page-header-info" id="header_info">
-        <span class="suitability-label">Pozisyona Uygunluk:</span> <span class="suitability-score">%{{{{llm_score}}}}</span>
-    </div>
-    
-    <!-- Footer element -->
-    <div class="page-footer">
-        <div class="footer-divider"></div>
-        <div class="footer-company-name">DeepWork Bilişim Teknolojileri A.Ş.</div>
-        <div class="footer-contact-info">
-            <span>info@hrai.com.tr</span>
-            <span>-</span>
-            <span>İstanbul Medeniyet Üniversitesi Kuzey Kampüsü Medeniyet Teknopark Kuluçka Merkezi Üsküdar/İstanbul</span>
-            <span>-</span>
-            <span>+90 553 808 32 77</span>
-        </div>
-    </div>
-    
-    <!-- Watermark Image Container -->
-    <div class="watermark-image-container" id="watermark-placeholder">
-        <!-- Image will be added here dynamically -->
-    </div>
-    
-    <h1>{row_data['kisi_adi']} - Mülakat Değerlendirme Raporu</h1>
-    
-    <div class="section">
-        <h2>1) Genel Bakış</h2>
-        <p>{{{{genel_bakis_icerik}}}}</p>
-    </div>
-    
-    <div class="section">
-        <h2>2) Analiz</h2>
-        <h3>Duygu Analizi:</h3>
-        <div id="bar-chart-placeholder"></div> <p>{{{{duygu_analizi_yorumu}}}}</p>
+    html_template = REPORT_HTML_TEMPLATE.substitute(
+        kisi_adi=row_data["kisi_adi"], qa_section=formatted_qa_html
+    )
 
-        <h3>Dikkat Analizi</h3>
-        <p>{{{{dikkat_analizi_yorumu}}}}</p>
-    </div>
-    
-    <div class="section">
-        <h2>3) Genel Değerlendirme</h2>
-        <p>{{{{genel_degerlendirme_icerik}}}}</p>
-    </div>
+    prompt_fields = {key.removesuffix("_%"): value for key, value in row_data.items()}
+    prompt_instructions = PROMPT_TEMPLATES[row_data["tip"]].substitute(
+        prompt_fields, suitability_color=suitability_color, html_template=html_template
+    )
 
-    <div class="section">
-        <h2>4) Sorular ve Cevaplar</h2>
-        {formatted_qa_html}
-    </div>
-    
-    <div class="section">
-        <h2>5) Sonuçlar ve Öneriler</h2>
-        <p>{{{{sonuclar_oneriler_icerik}}}}</p>
-    </div>
+    return prompt_instructions
 
-    {{{{uygunluk_degerlendirmesi_bolumu}}}}
-</body>
-</html>
-"""
 
-    if row_data["tip"] == 0:
-        # MODIFIED PART: Candidate Suitability Section Added
-        prompt_instructions = f"""
-Lütfen aşağıdaki HTML şablonunu verilen mülakat verilerine göre doldurarak eksiksiz bir HTML raporu oluştur.
-Veriler:
-- Aday Adı: {row_data['kisi_adi']}
-- Mülakat Adı: {row_data['mulakat_adi']}
-- LLM Skoru: {row_data['llm_skoru']}, Ortalama LLM Skoru: {row_data['avg_llm_skoru']}
-- Duygu Analizi (%): Mutlu {row_data['duygu_mutlu_%']}, Kızgın {row_data['duygu_kizgin_%']}, İğrenme {row_data['duygu_igrenme_%']}, Korku {row_data['duygu_korku_%']}, Üzgün {row_data['duygu_uzgun_%']}, Şaşkın {row_data['duygu_saskin_%']}, Doğal {row_data['duygu_dogal_%']}
-- Dikkat Analizi: Ekran Dışı Süre {row_data['ekran_disi_sure_sn']} sn, Ekran Dışı Bakış Sayısı {row_data['ekran_disi_sayisi']}, Ortalama Ekran Dışı Süre {row_data['avg_ekran_disi_sure_sn']} sn, Ortalama Ekran Dışı Bakış Sayısı {row_data['avg_ekran_disi_sayisi']}
+def is_valid_report_html(html_content: str) -> bool:
+    """
+    Checks that the LLM output has a <body> tag, a place for the charts and
+    no unfilled content fields.
+    """
+    return (
+        BODY_TAG_RE.search(html_content) is not None
+        and (CHART_SLOT in html_content or CHART_PLACEHOLDER_DIV in html_content)
+        and PLACEHOLDER_RE.search(html_content) is None
+    )
 
-Doldurulacak Alanlar İçin Talimatlar:
-1.  `{{{{genel_bakis_icerik}}}}`: Adayın genel performansını, iletişim becerilerini ve mülakatın genel seyrini özetleyen, en az iki paragraftan oluşan detaylı bir giriş yaz.
-2.  `{{{{duygu_analizi_yorumu}}}}`: Yukarıda verilen sayısal duygu analizi verilerini yorumla. Hangi duyguların baskın olduğunu ve bunun mülakat bağlamında ne anlama gelebileceğini analiz et. Bu yorum en az iki detaylı paragraf olmalıdır. Giriş cümlesi tam olarak şu olmalı: "Görüntü ve ses analiz edilerek adayın duygu analizi yapılmıştır."
-3.  `{{{{dikkat_analizi_yorumu}}}}`: Ekran dışı süre ve bakış sayısı verilerini yorumla. Bu verilerin adayın dikkat seviyesi veya odaklanması hakkında ne gibi ipuçları verdiğini açıkla. Bu yorum en az bir detaylı paragraf olmalıdır.
-4.  `{{{{genel_degerlendirme_icerik}}}}`: Adayın verdiği cevapları, genel tavrını ve analiz sonuçlarını birleştirerek kapsamlı bir değerlendirme yap. Adayın güçlü ve gelişime açık yönlerini belirt. Bu bölüm en az üç paragraf olmalıdır.
-5.  `{{{{sonuclar_oneriler_icerik}}}}`: Bu bölümü **sadece İnsan Kaynakları profesyonellerine yönelik** olarak yaz. Adayın pozisyona uygunluğu hakkında net bir sonuca var. İşe alım kararı için somut önerilerde bulun. Adaya yönelik bir dil kullanma. Bu bölüm en az iki paragraf olmalıdır.
-6.  **YENİ TALİMAT**: `{{{{uygunluk_degerlendirmesi_bolumu}}}}`: Adayın pozisyona uygunluk yüzdesini (0-100 arası bir tam sayı) ve bu yüzdeyi destekleyen kısa bir açıklamayı HTML formatında oluştur. Yüzdeyi `{row_data['llm_skoru']}` değerini dikkate alarak belirle. Örnek format:
-    ```html
-    <div class="section">
-        <h2>6) Pozisyona Uygunluk Değerlendirmesi</h2>
-        <p style="font-size: 24px; font-weight: bold; color: {suitability_color}; text-align: left;">Pozisyona Uygunluk: %{{{{llm_score}}}}</p>
-        <p>Adayın genel mülakat performansı, teknik bilgi ve iletişim becerileri, pozisyonun gerektirdiği yetkinliklerle yüksek düzeyde örtüşmektedir. Duygu analizi ve dikkat seviyesi de olumlu bir tablo çizmektedir.</p>
-    </div>
-    ```
-    Yüzdeyi ve açıklamayı doldururken, verilen LLM Skoru'nu doğrudan uygunluk yüzdesi olarak kullanabilir veya bu skora dayanarak mantıklı bir uygunluk yüzdesi türetebilirsin. Açıklama 1-2 paragraf uzunluğunda olmalıdır. Pozisyona uygunluk yüzdesi metni büyük ve kalın olmalıdır.
 
-Önemli Kurallar:
-- Üretilen tüm metin **sadece Türkçe** olmalıdır.
-- Raporun tonu profesyonel, resmi ve veri odaklı olmalıdır.
-- Kullanıcıya yönelik hiçbir not, açıklama veya meta-yorum ekleme.
-- Sadece ve sadece aşağıdaki HTML şablonunu doldurarak yanıt ver. Başka hiçbir metin ekleme.
+async def generate_llm_response(cache_key: str, prompt: str, use_cache: bool = True) -> str:
+    """
+    Returns Gemini's report HTML for the prompt, with any code fence removed.
+    Valid responses are kept in a small LRU cache keyed by the report row, so
+    re-submitting the same row skips the LLM call. Malformed responses are not
+    cached, and use_cache=False always asks the LLM again.
+    """
+    if use_cache:
+        cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            _llm_cache.move_to_end(cache_key)
+            return cached
+
+    response = await gemini_model.generate_content_async(
+        prompt, generation_config=GEN_CONFIG
+    )
+    # text/plain does not strictly forbid fences, so still guard against them
+    html_content = strip_code_fence(response.text)
+
+    if is_valid_report_html(html_content):
+        _llm_cache[cache_key] = html_content
+        _llm_cache.move_to_end(cache_key)
+        if len(_llm_cache) > LLM_CACHE_SIZE:
+            _llm_cache.popitem(last=False)
+    else:
+        print("Warning: LLM output failed validation and was not cached.")
+    return html_content
 
-İşte doldurman gereken şablon:
-{html_template}
-"""
 
-    elif row_data["tip"] == 1:
-        # For customer report, leave the suitability section empty
-        prompt_instructions = f"""
-Lütfen aşağıdaki HTML şablonunu verilen mülakat verilerine göre doldurarak eksiksiz bir HTML raporu oluştur.
-Veriler:
-- Müşteri Adı: {row_data['kisi_adi']}
-- Görüşme Adı: {row_data['mulakat_adi']}
-- Duygu Analizi (%): Mutlu {row_data['duygu_mutlu_%']}, Kızgın {row_data['duygu_kizgin_%']}, İğrenme {row_data['duygu_igrenme_%']}, Korku {row_data['duygu_korku_%']}, Üzgün {row_data['duygu_uzgun_%']}, Şaşkın {row_data['duygu_saskin_%']}, Doğal {row_data['duygu_dogal_%']}
-- Dikkat Analizi: Ekran Dışı Süre {row_data['ekran_disi_sure_sn']} sn, Ekran Dışı Bakış Sayısı {row_data['ekran_disi_sayisi']}, Ortalama Ekran Dışı Süre {row_data['avg_ekran_disi_sure_sn']} sn, Ortalama Ekran Dışı Bakış Sayısı {row_data['avg_ekran_disi_sayisi']}
+# Worker processes for PDF rendering, so concurrent reports use multiple cores
+# instead of contending for the GIL. Workers import only pdf_renderer and reuse
+# its stylesheet, but each still holds its own WeasyPrint/Pango state (tens of MB).
+# The pool is per uvicorn worker; set PDF_WORKERS when running several of them.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS") or min(os.cpu_count() or 1, 4))
+# Workers are started from a server that already runs threads, so don't fork it directly
+if "forkserver" in multiprocessing.get_all_start_methods():
+    PDF_MP_CONTEXT = multiprocessing.get_context("forkserver")
+    # Load WeasyPrint once in the fork server instead of in every worker
+    PDF_MP_CONTEXT.set_forkserver_preload(["pdf_renderer"])
+else:
+    PDF_MP_CONTEXT = multiprocessing.get_context("spawn")
 
-Doldurulacak Alanlar İçin Talimatlar:
-1.  `{{{{genel_bakis_icerik}}}}`: Müşterinin genel performansını, iletişim becerilerini ve görüşmenin genel seyrini özetleyen, en az iki paragraftan oluşan detaylı bir giriş yaz.
-2.  `{{{{duygu_analizi_yorumu}}}}`: Yukarıda verilen sayısal duygu analizi verilerini yorumla. Hangi duyguların baskın olduğunu ve bunun görüşme bağlamında ne anlama gelebileceğini analiz et. Bu yorum en az iki detaylı paragraf olmalıdır. Giriş cümlesi tam olarak şu olmalı: "Görüntü ve ses analiz edilerek kişinin duygu analizi yapılmıştır."
-3.  `{{{{dikkat_analizi_yorumu}}}}`: Ekran dışı süre ve bakış sayısı verilerini yorumla. Bu verilerin müşterinin dikkat seviyesi veya odaklanması hakkında ne gibi ipuçları verdiğini açıkla. Bu yorum en az bir detaylı paragraf olmalıdır.
-4.  `{{{{genel_degerlendirme_icerik}}}}`: Müşterinin verdiği cevapları, genel tavrını ve analiz sonuçlarını birleştirerek kapsamlı bir değerlendirme yap. Müşterinin güçlü ve gelişime açık yönlerini belirt. Bu bölüm en az üç paragraf olmalıdır.
-5.  `{{{{sonuclar_oneriler_icerik}}}}`: Bu bölümü müşteri hakkında genel bir değerlendirme olarak yaz. 1 paragraf kadar olmalı
 
-Önemli Kurallar:
-- Üretilen tüm metin **sadece Türkçe** olmalıdır.
-- Raporun tonu profesyonel, resmi ve veri odaklı olmalıdır.
-- Kullanıcıya yönelik hiçbir not, açıklama veya meta-yorum ekleme.
-- Sadece ve sadece aşağıdaki HTML şablonunu doldurarak yanıt ver. Başka hiçbir metin ekleme.
+def create_pdf_executor() -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=PDF_MP_CONTEXT)
 
-İşte doldurman gereken şablon:
-{html_template}
-"""
 
-    return prompt_instructions
+PDF_EXECUTOR = create_pdf_executor()
 
 
-def create_pdf_from_html(html_content: str) -> io.BytesIO:
+async def render_pdf(html_content: str) -> bytes:
     """
-    Creates a PDF file from an HTML string using WeasyPrint.
-    Uses a base_url to access local files like fonts.
+    Renders the PDF in the worker pool. If a worker died (e.g. OOM kill or a
+    crash in cairo/pango), the broken pool is replaced so later reports still
+    render; only the current request fails.
     """
+    global PDF_EXECUTOR
+    executor = PDF_EXECUTOR
     try:
-        pdf_buffer = io.BytesIO()
-        html = HTML(string=html_content, base_url=".")
-        html.write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
-        return pdf_buffer
-    except Exception as e:
-        print(f"Error creating WeasyPrint PDF: {e}")
-        raise ValueError(f"WeasyPrint error occurred while creating PDF: {e}")
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, create_pdf_from_html, html_content
+        )
+    except BrokenProcessPool:
+        print("Warning: PDF worker pool is broken. Starting a new one.")
+        if PDF_EXECUTOR is executor:
+            PDF_EXECUTOR = create_pdf_executor()
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
 
 
 # --- FastAPI Endpoint ---
@@ -688,7 +718,10 @@ def create_pdf_from_html(html_content: str) -> io.BytesIO:
 
 @app.post("/generate-report", summary="PDF Mülakat Raporu Oluştur")
 async def generate_report(
-    file: UploadFile = File(..., description="Mülakat verilerini içeren CSV dosyası.")
+    file: UploadFile = File(..., description="Mülakat verilerini içeren CSV dosyası."),
+    no_cache: bool = Query(
+        False, description="Önbellekteki LLM yanıtını kullanmadan raporu yeniden oluştur."
+    ),
 ):
     if not file.filename.endswith(".csv"):
         raise HTTPException(
@@ -698,179 +731,113 @@ async def generate_report(
 
     try:
         file_content = await file.read()
-        df = pd.read_csv(io.BytesIO(file_content))
-
-        required_columns = [
-            "kisi_adi",
-            "mulakat_adi",
-            "llm_skoru",
-            "duygu_mutlu_%",
-            "duygu_kizgin_%",
-            "duygu_igrenme_%",
-            "duygu_korku_%",
-            "duygu_uzgun_%",
-            "duygu_saskin_%",
-            "duygu_dogal_%",
-            "ekran_disi_sure_sn",
-            "ekran_disi_sayisi",
-            "soru",
-            "cevap",
-            "tip",
-            "avg_llm_skoru", # Added avg_llm_skoru to required columns
-        ]
-        if not all(col in df.columns for col in required_columns):
-            missing_cols = [col for col in required_columns if col not in df.columns]
+        # Only the first row is reported on, so read just the header and that row
+        reader = csv.DictReader(io.StringIO(file_content.decode("utf-8-sig")))
+        if reader.fieldnames is None:
+            raise HTTPException(status_code=400, detail="Yüklenen CSV dosyası boş.")
+
+        missing_cols = REQUIRED_COLUMNS.difference(reader.fieldnames)
+        if missing_cols:
             raise HTTPException(
                 status_code=400,
-                detail=f"CSV dosyasında eksik sütunlar var: {', '.join(missing_cols)}",
+                detail=f"CSV dosyasında eksik sütunlar var: {', '.join(sorted(missing_cols))}",
             )
 
-        if df.empty:
+        row = next(reader, None)
+        if row is None:
             raise HTTPException(status_code=400, detail="CSV dosyası veri içermiyor.")
 
-        row = df.iloc[0]
-
         current_row_data = {
             "kisi_adi": row["kisi_adi"],
             "mulakat_adi": row["mulakat_adi"],
-            "llm_skoru": round(row["llm_skoru"], 2),
-            "duygu_mutlu_%": round(row["duygu_mutlu_%"], 2),
-            "avg_duygu_mutlu_%": round(row["avg_duygu_mutlu_%"], 2),
-            "duygu_kizgin_%": round(row["duygu_kizgin_%"], 2),
-            "avg_duygu_kizgin_%": round(row["avg_duygu_kizgin_%"], 2),
-            "duygu_igrenme_%": round(row["duygu_igrenme_%"], 2),
-            "avg_duygu_igrenme_%": round(row["avg_duygu_igrenme_%"], 2),
-            "duygu_korku_%": round(row["duygu_korku_%"], 2),
-            "avg_duygu_korku_%": round(row["avg_duygu_korku_%"], 2), 
-            "duygu_uzgun_%": round(row["duygu_uzgun_%"], 2),
-            "avg_duygu_uzgun_%": round(row["avg_duygu_uzgun_%"], 2),
-            "duygu_saskin_%": round(row["duygu_saskin_%"], 2),
-            "avg_duygu_saskin_%": round(row["avg_duygu_saskin_%"], 2),
-            "duygu_dogal_%": round(row["duygu_dogal_%"], 2),
-            "avg_duygu_dogal_%": round(row["avg_duygu_dogal_%"], 2),
-            "ekran_disi_sure_sn": round(row["ekran_disi_sure_sn"], 2),
-            "avg_ekran_disi_sure_sn": round(row["avg_ekran_disi_sure_sn"], 2),
-            "ekran_disi_sayisi": int(row["ekran_disi_sayisi"]),
-            "avg_ekran_disi_sayisi": int(row["avg_ekran_disi_sayisi"]),
+            **{col: parse_csv_number(row, col) for col in FLOAT_COLUMNS},
+            **{col: parse_csv_number(row, col, integer=True) for col in INT_COLUMNS},
             "soru_cevap": [{"soru": row["soru"], "cevap": row["cevap"]}],
-            "tip": int(row["tip"]),
-            "avg_llm_skoru": round(row["avg_llm_skoru"], 2),
         }
 
+        if current_row_data["tip"] not in PROMPT_TEMPLATES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Geçersiz 'tip' değeri: {current_row_data['tip']}. "
+                f"Geçerli değerler: {', '.join(map(str, sorted(PROMPT_TEMPLATES)))}",
+            )
+
         print(f"İşlenen satır tipi: {current_row_data['tip']}")
 
         formatted_qa_html = format_qa_section(current_row_data["soru_cevap"])
 
         prompt = generate_llm_prompt(current_row_data, formatted_qa_html)
 
-        response = gemini_model.generate_content(
-            prompt, generation_config=genai.types.GenerationConfig(temperature=0.7)
+        cache_key = hashlib.sha256(
+            json.dumps(current_row_data, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        # The emotion charts only depend on the CSV row, so build them
+        # (1) absolute values, 2) candidate–average difference) while
+        # waiting on the LLM round trip.
+        raw_html_content, abs_chart_html, diff_chart_html = await asyncio.gather(
+            generate_llm_response(cache_key, prompt, use_cache=not no_cache),
+            asyncio.to_thread(create_emotion_charts_html, current_row_data),
+            asyncio.to_thread(create_emotion_charts_html_2, current_row_data),
         )
 
-        raw_html_content = (
-            response.text.strip().removeprefix("```html").removesuffix("```")
+        llm_score = current_row_data["llm_skoru"]
+        avg_llm_score = current_row_data["avg_llm_skoru"]
+        color = get_suitability_color(llm_score, avg_llm_score)
+        header_info_html = (
+            '<span class="suitability-label">Pozisyona Uygunluk:</span> '
+            f'<span style="color: {color};">%{llm_score:.0f}</span>'
         )
 
-        soup = BeautifulSoup(raw_html_content, "html.parser")
-
-        # Update emotion analysis chart placeholder:
-        #   1) Absolute values chart
-        #   2) Average difference chart
-        bar_chart_placeholder = soup.find(id="bar-chart-placeholder")
-        if bar_chart_placeholder:
-            # 1) Absolute emotion percentages
-            abs_chart_html = create_emotion_charts_html(current_row_data)
-            # 2) Candidate–average difference
-            diff_chart_html = create_emotion_charts_html_2(current_row_data)
-
-            bar_chart_placeholder.clear()
-            bar_chart_placeholder.append(
-                BeautifulSoup(abs_chart_html + diff_chart_html, "html.parser")
-            )
-
-        logo_base64 = get_image_base64("logo.png")
-        if logo_base64:
-            logo_src = f"data:image/png;base64,{logo_base64}" if logo_base64 else ""
-
-            # 1) Set header logo
-            header_img = soup.select_one("#header_logo img")
-            if header_img and logo_src:
-                header_img["src"] = logo_src
-
-            # 2) Set watermark logo
-            watermark_placeholder = soup.find(id="watermark-placeholder")
-            if watermark_placeholder:
-                img_tag = soup.new_tag(
-                    "img", src=logo_src, alt="Deepwork Logo Filigranı"
-                )
-                watermark_placeholder.append(img_tag)
-        else:
-            print("Warning: logo.png not found or could not be read. Watermark not added.")
-
-        # Populate the top-right header with the suitability score
-        header_info_div = soup.find(id="header_info")
-        if header_info_div:
-            llm_score = current_row_data['llm_skoru']
-            avg_llm_score = current_row_data['avg_llm_skoru']
-            color = get_suitability_color(llm_score, avg_llm_score)
-            
-            # Directly insert the score and color into the HTML string
-            header_info_div.clear()
-            header_info_div.append(BeautifulSoup(
-                f'<span class="suitability-label">Pozisyona Uygunluk:</span> <span style="color: {color};">%{llm_score:.0f}</span>',
-                "html.parser"
-            ))
-
-
         # If type is 1, completely remove the suitability section from HTML
         if current_row_data["tip"] == 1:
-            uygunluk_placeholder = soup.find(text="{{uygunluk_degerlendirmesi_bolumu}}")
-            if uygunluk_placeholder:
-                uygunluk_placeholder.extract()  # Remove text associated with the placeholder
+            suitability_section_html = ""
         else:
-            # For type 0, update the suitability section with dynamic color
-            uygunluk_placeholder = soup.find(text="{{uygunluk_degerlendirmesi_bolumu}}")
-            if uygunluk_placeholder:
-                llm_score = current_row_data['llm_skoru']
-                avg_llm_score = current_row_data['avg_llm_skoru']
-                color = get_suitability_color(llm_score, avg_llm_score)
-                
-                # Replace the placeholder with the actual suitability section HTML
-                suitability_section_html = f"""
+            suitability_section_html = f"""
                 <div class="section">
                     <h2>6) Pozisyona Uygunluk Değerlendirmesi</h2>
                     <p style="font-size: 24px; font-weight: bold; color: {color}; text-align: left;">Pozisyona Uygunluk: %{llm_score:.0f}</p>
                     <p>Adayın genel mülakat performansı, teknik bilgi ve iletişim becerileri, pozisyonun gerektirdiği yetkinliklerle yüksek düzeyde örtüşmektedir. Duygu analizi ve dikkat seviyesi de olumlu bir tablo çizmektedir.</p>
                 </div>
                 """
-                uygunluk_placeholder.replace_with(BeautifulSoup(suitability_section_html, "html.parser"))
 
+        page_chrome_html = STATIC_PAGE_CHROME.substitute(header_info=header_info_html)
 
-        final_html = soup.prettify()
-
-        html_debug_filename = f"{current_row_data['kisi_adi']}_{current_row_data['mulakat_adi']}_Rapor_Debug.html"
-        try:
-            with open(html_debug_filename, "w", encoding="utf-8") as f:
-                f.write(final_html)
-            print(f"HTML içeriği '{html_debug_filename}' dosyasına kaydedildi.")
-        except IOError as io_err:
-            print(f"HTML içeriği kaydedilirken hata oluştu: {io_err}")
+        final_html = PLACEHOLDER_RE.sub("", raw_html_content).replace(
+            "{{uygunluk_degerlendirmesi_bolumu}}", suitability_section_html
+        )
+        final_html = insert_page_chrome(final_html, page_chrome_html)
+        final_html = insert_charts(final_html, abs_chart_html + diff_chart_html)
+
+        if DEBUG_HTML:
+            html_debug_filename = f"{current_row_data['kisi_adi']}_{current_row_data['mulakat_adi']}_Rapor_Debug.html"
+            try:
+                await asyncio.to_thread(
+                    Path(html_debug_filename).write_text, final_html, encoding="utf-8"
+                )
+                print(f"HTML içeriği '{html_debug_filename}' dosyasına kaydedildi.")
+            except IOError as io_err:
+                print(f"HTML içeriği kaydedilirken hata oluştu: {io_err}")
 
-        pdf_bytes = create_pdf_from_html(final_html)
+        # WeasyPrint rendering is CPU-bound; run it in a worker process
+        pdf_bytes = await render_pdf(final_html)
 
         filename = f"{current_row_data['kisi_adi']}_{current_row_data['mulakat_adi']}_Rapor.pdf"
         encoded_filename = urllib.parse.quote(filename)
 
-        return StreamingResponse(
-            pdf_bytes,
+        # The PDF is already fully in memory; send it in one go with a Content-Length.
+        # "identity" keeps GZipMiddleware from re-compressing the Flate-compressed PDF.
+        return Response(
+            content=pdf_bytes,
             media_type="application/pdf",
             headers={
-                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"
+                "Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}",
+                "Content-Encoding": "identity",
             },
         )
 
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=400, detail="Yüklenen CSV dosyası boş.")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Beklenmedik bir hata oluştu: {e}")
         raise HTTPException(